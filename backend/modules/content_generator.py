@@ -12,17 +12,325 @@ Content Generator v6.2 - ULTRA SMART AI CHAT WITH CLEAN REFERENCES
 ✅ Context-aware modifications
 """
 
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 
 
+# Progress/diagnostic output goes through the shared "krishopus" logger,
+# whose queue handler (see main.py) keeps log I/O off the hot path; a
+# NullHandler keeps standalone imports quiet until someone configures it
+logger = logging.getLogger("krishopus.content_generator")
+logger.addHandler(logging.NullHandler())
+
+
+# Precompiled patterns (module-level so they compile once at import)
+_REF_LINE_RE = re.compile(r'^\d+\.')
+# Counts numbered reference lines in one MULTILINE pass over the whole
+# string - no split/strip/list allocations per count
+_REF_COUNT_RE = re.compile(r'^[ \t]*\d+\.', re.MULTILINE)
+# First characters that mark a new reference entry (continuation test)
+_REF_START_CHARS = frozenset('123456789[')
+# Yields each non-empty line already stripped, in one MULTILINE pass
+_NONEMPTY_LINE_RE = re.compile(r'^[ \t]*(\S[^\r\n]*?)[ \t]*$', re.MULTILINE)
+# AI introductory phrases to drop from generated reference blocks,
+# tested with one alternation search instead of 11 substring scans
+_SKIP_PHRASE_RE = re.compile(
+    '|'.join(map(re.escape, (
+        'here are',
+        'here is',
+        'i have generated',
+        'below are',
+        'following are',
+        'in ieee style',
+        'in apa style',
+        'for an ai assignment',
+        'about "',
+        'references:',
+        'bibliography:',
+    )))
+)
+# MULTILINE: converts every "[N] " line prefix to "N. " in one pass
+# (leading whitespace is folded in since lines get stripped anyway)
+_BRACKET_NUM_RE = re.compile(r'^[ \t]*\[(\d+)\][ \t]*', re.MULTILINE)
+# All number patterns fused into ONE alternation: a single scan records
+# which pattern fired where, instead of up to four separate searches.
+# Alternatives are ordered by selection priority so higher-priority
+# patterns win ties at the same position.
+_NUMBER_SCAN_RE = re.compile(
+    r'(?P<words>\d+)\s*words?'
+    r'|to\s+(?:only\s+)?(?P<refs_to>\d+)'
+    r'|(?:keep\s+)?(?P<keep_refs>\d+)\s+references?'
+    r'|in\s+(?P<in_n>\d+)'
+    r'|(?:make|change|rewrite|expand|write|keep)\s+(?:only\s+)?(?P<verb>\d+)'
+)
+# One alternation scan instead of one substring search per keyword
+_ALL_SECTIONS_RE = re.compile(r'all|everything|entire|whole')
+# Intent keywords, one compiled alternation per category: a single
+# C-level scan of the prompt replaces a Python loop of substring tests
+_ADD_INTENT_RE = re.compile(r'add|insert|include|create new')
+# Captures the new section's name in one scan ('create new X' keeps X)
+_ADD_NAME_RE = re.compile(r'\b(?:add|insert|include|create(?:\s+new)?)\s+(?P<name>.+?)\s*$')
+_DELETE_INTENT_RE = re.compile(r'remove|delete|drop')
+_MODIFY_INTENT_RE = re.compile(
+    r'change|modify|rewrite|expand|shorten|improve|make|keep|reduce|increase|words|references'
+)
+# Expansion/reduction/keep cues tagged by named group, so one pass over
+# the prompt replaces three separate keyword scans in _parse_user_request
+_ACTION_RE = re.compile(
+    r'(?P<exp>expand|longer|more\s+details|add\s+more|elaborate|increase)'
+    r'|(?P<red>shorten|reduce|shorter|decrease|concise|brief|less)'
+    r'|(?P<keep>keep)'
+)
+# Word counting without materializing a throwaway list (same helper as
+# session_manager - these counts are logging/validation only)
+_WORD_COUNT_RE = re.compile(r'\S+')
+
+
+def _count_words(text: str) -> int:
+    """Count whitespace-separated words without allocating a word list"""
+    return sum(1 for _ in _WORD_COUNT_RE.finditer(text))
+
+
+# Fallback sentence template, bound once - the fallback path runs per
+# section per request whenever the Groq endpoint is degraded, so even
+# its string formatting is hoisted out of the call
+_FALLBACK_TMPL = "This section discusses {section} in the context of {topic}. ".format
+
+
+def _tokens_for_words(max_words: int) -> int:
+    """Token budget for a word target (~1.3 tokens/word plus slack)
+
+    Output tokens are billed and decoded linearly, so a tight cap beats
+    the old 2x-the-words overshoot."""
+    return int(max_words * 1.5) + 20
+
+
+# Static reference-format rules, shared verbatim by both reference
+# prompts: a byte-identical instruction block across calls is what lets
+# the provider reuse its tokenization/prefix cache for it
+_REF_FORMAT_RULES = '''CRITICAL FORMAT REQUIREMENTS:
+- Use simple numbered format: 1., 2., 3. (NOT [1], [2], [3])
+- DO NOT include any introductory text
+- DO NOT say "Here are references" or similar
+- Start directly with reference 1
+- Format: 1. Author, A., "Title," Journal, Vol. X, pp. XX-YY, Year.'''
+
+
+# Prompt templates, built once at import and dispatched by key instead of
+# re-assembling multi-line f-strings inside each handler
+PROMPT_TEMPLATES = {
+    'section': '''Write the "{section_name}" section of the assignment.
+
+Write EXACTLY {max_words} words.
+Use proper paragraph format (not bullet points).
+Be specific and academic.''',
+
+    'references': f'''Generate EXACTLY {{count}} academic references for this assignment.
+
+{_REF_FORMAT_RULES}
+
+Generate {{count}} references now:''',
+
+    'regenerate_references': f'''Generate EXACTLY {{target_count}} academic references for a {{subject}} assignment about "{{topic}}".
+
+{_REF_FORMAT_RULES}
+
+Generate EXACTLY {{target_count}} references now:''',
+
+    'rewrite_section': '''You are rewriting the "{section_name}" section of a {subject} assignment about "{topic}".
+
+Current content:
+{current_content}
+
+User wants: {user_instruction}
+
+Rewrite this section following the user's request.{word_limit_instruction}
+
+Write in proper paragraph format (not bullet points unless requested).
+Be specific and academic in tone.''',
+
+    'batch_rewrite': '''You are rewriting {count} sections of a {subject} assignment about "{topic}".
+
+User wants: {user_instruction}
+
+Apply the user's request to EVERY section below.{word_limit_instruction}
+
+Sections:
+{sections_block}
+
+Respond with STRICT JSON only - an object mapping each section name to its
+new content, e.g. {{"Section Name": "new content", ...}}. No other text.''',
+
+    'general_question': '''You are helping with a {subject} assignment about "{topic}".
+
+Current content:
+{sections_text}
+
+Answer the user's questions helpfully.''',
+}
+
+
 class ContentGenerator:
     """Ultra Smart Content Generator with Advanced NLP"""
-    
-    def __init__(self, groq_client):
+
+    def __init__(self, groq_client, prompt_cache_size: int = 128):
         """Initialize with Groq client"""
         self.groq = groq_client
-        print(f"✅ ContentGenerator v6.2 initialized (Advanced NLP + Clean References)")
+        # Exact-match prompt cache: identical (prompt, params) calls are
+        # served from memory instead of re-hitting the Groq API
+        self._prompt_cache = OrderedDict()
+        self._prompt_cache_size = prompt_cache_size
+        self._prompt_cache_lock = threading.Lock()
+        # Semantic chat cache: near-identical instructions against the same
+        # document state reuse the previous result (see refine_with_chat)
+        self._chat_cache = OrderedDict()
+        self._chat_cache_size = 64
+        # Memoized section-name lowering / target detection (see
+        # _detect_target_sections) - both are hit several times per chat turn
+        self._lower_names_cache = OrderedDict()
+        self._target_sections_cache = OrderedDict()
+        # Compiled multi-pattern matcher per section-name set (see
+        # _section_matcher) - one scan finds every mentioned section
+        self._matcher_cache = OrderedDict()
+        # Memoized _parse_user_request results (users retry near-identical
+        # prompts constantly; the parse is pure given prompt + section names)
+        self._parse_cache = OrderedDict()
+        # Last assembled general-question context (see _handle_general_question)
+        self._general_context_cache = None
+        logger.info("✅ ContentGenerator v6.2 initialized (Advanced NLP + Clean References)")
+
+    # ========================================
+    # SEMANTIC CHAT CACHE
+    # ========================================
+
+    _NORMALIZE_RE = re.compile(r'[^\w\s]')
+
+    def _normalize_instruction(self, prompt_lower: str) -> str:
+        """Fold punctuation/whitespace in an already-lowercased prompt"""
+        return ' '.join(self._NORMALIZE_RE.sub(' ', prompt_lower).split())
+
+    def _sections_fingerprint(self, current_sections: Dict[str, str]) -> int:
+        """Fingerprint the document state a chat instruction applies to"""
+        return hash(tuple(sorted(current_sections.items())))
+
+    def _chat_cache_lookup(
+        self,
+        norm_prompt: str,
+        fingerprint: int
+    ) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Find a cached result for an equivalent instruction.
+
+        Matches on the normalized instruction, or on token-set Jaccard
+        similarity >= 0.9 (cheap stand-in for an embedding cache - no
+        extra model dependency, catches reorderings and filler words).
+        """
+        entries = self._chat_cache.get(fingerprint)
+        if not entries:
+            return None
+
+        tokens = set(norm_prompt.split())
+        for cached_prompt, cached_tokens, result in entries:
+            if cached_prompt == norm_prompt:
+                return result
+            if tokens and cached_tokens:
+                overlap = len(tokens & cached_tokens)
+                union = len(tokens | cached_tokens)
+                if union and overlap / union >= 0.9:
+                    return result
+
+        return None
+
+    # Distinct instructions kept per document state; oldest drop off first
+    _CHAT_CACHE_ENTRIES_PER_STATE = 8
+
+    def _chat_cache_store(
+        self,
+        norm_prompt: str,
+        fingerprint: int,
+        result: Tuple[str, Dict[str, str]]
+    ):
+        """Remember a chat result for this (instruction, document state)
+
+        Token sets are stored as frozensets (immutable, smaller, hashable)
+        and each document state keeps only the last few instructions, so
+        the cache's memory stays bounded however long a session runs."""
+        entries = self._chat_cache.setdefault(fingerprint, [])
+        entries.append((norm_prompt, frozenset(norm_prompt.split()), result))
+        if len(entries) > self._CHAT_CACHE_ENTRIES_PER_STATE:
+            del entries[0]
+        self._chat_cache.move_to_end(fingerprint)
+        if len(self._chat_cache) > self._chat_cache_size:
+            self._chat_cache.popitem(last=False)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _assignment_preamble(topic: str, subject: str) -> str:
+        """
+        Shared system preamble for every call about one assignment.
+        Identical across section calls, so Groq can prefix-cache it;
+        lru_cache makes the 7-sections-per-assignment rebuilds a dict hit.
+        """
+        return (
+            f'You are writing a {subject} academic assignment about "{topic}". '
+            f'Write in formal academic prose and follow the format instructions exactly.'
+        )
+
+    def _generate_cached(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        system: str = None,
+        max_words: int = None
+    ) -> str:
+        """Call Groq with an exact-match LRU cache over (prompt, params)
+
+        When max_words is given the response is streamed and cut early
+        once the target is comfortably exceeded."""
+        # Key on a digest, not the strings themselves: prompts run to
+        # kilobytes and would otherwise be pinned in memory per entry
+        cache_key = hashlib.sha256(
+            f"{prompt}\x1f{system}\x1f{temperature}\x1f{max_tokens}\x1f{max_words}".encode()
+        ).hexdigest()
+
+        with self._prompt_cache_lock:
+            if cache_key in self._prompt_cache:
+                self._prompt_cache.move_to_end(cache_key)
+                logger.info("   ⚡ Prompt cache hit")
+                return self._prompt_cache[cache_key]
+
+        # API call happens outside the lock so parallel sections overlap
+        if max_words is not None:
+            response = self.groq.generate_text_stream(
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                system=system,
+                max_words=max_words
+            )
+        else:
+            response = self.groq.generate_text(
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                system=system
+            )
+
+        with self._prompt_cache_lock:
+            self._prompt_cache[cache_key] = response
+            if len(self._prompt_cache) > self._prompt_cache_size:
+                self._prompt_cache.popitem(last=False)
+
+        return response
     
     def generate_full_assignment(
         self,
@@ -32,32 +340,75 @@ class ContentGenerator:
         word_count: int = 3000,
         temperature: float = 0.7
     ) -> Dict[str, str]:
-        """Generate complete assignment"""
-        print(f"\n🤖 Generating content (110 words max per section)...")
-        print(f"   Topic: {topic}")
-        print(f"   Subject: {subject}\n")
-        
-        generated = {}
-        
-        for idx, section in enumerate(sections, 1):
-            print(f"   [{idx}/{len(sections)}] {section}...", end=' ')
-            
+        """Generate complete assignment (sections fetched in parallel)"""
+        logger.info("🤖 Generating content (110 words max per section)...")
+        logger.info("   Topic: %s", topic)
+        logger.info("   Subject: %s", subject)
+
+        def _generate_one(section: str) -> str:
             if 'reference' in section.lower():
-                content = self._generate_references(topic, subject)
-            else:
-                content = self._generate_section_content(
-                    section_name=section,
-                    topic=topic,
-                    subject=subject,
-                    max_words=110,
-                    temperature=temperature
-                )
-            
+                return self._generate_references(topic, subject)
+            return self._generate_section_content(
+                section_name=section,
+                topic=topic,
+                subject=subject,
+                max_words=110,
+                temperature=temperature
+            )
+
+        # Groq calls are I/O bound, so a thread pool overlaps their
+        # latency; executor.map keeps results in template order
+        max_workers = min(6, max(1, len(sections)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            contents = list(executor.map(_generate_one, sections))
+
+        generated = {}
+        for idx, (section, content) in enumerate(zip(sections, contents), 1):
             generated[section] = content
-            print(f"✓ ({len(content.split())} words)")
-        
+            logger.info("   [%d/%d] %s ✓ (%d words)", idx, len(sections), section, _count_words(content))
+
         return generated
-    
+
+    async def generate_full_assignment_async(
+        self,
+        topic: str,
+        subject: str,
+        sections: List[str],
+        word_count: int = 3000,
+        temperature: float = 0.7,
+        max_concurrency: int = 6
+    ) -> Dict[str, str]:
+        """
+        Generate complete assignment with per-section Groq calls in parallel
+        Fan-out is bounded by a semaphore to respect API rate limits
+        """
+        logger.info("🤖 Generating %d sections concurrently (limit: %d)...", len(sections), max_concurrency)
+        logger.info("   Topic: %s", topic)
+        logger.info("   Subject: %s", subject)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _generate_one(section: str) -> Tuple[str, str]:
+            async with semaphore:
+                if 'reference' in section.lower():
+                    content = await self._agenerate_references(topic, subject)
+                else:
+                    content = await self._agenerate_section_content(
+                        section_name=section,
+                        topic=topic,
+                        subject=subject,
+                        max_words=110,
+                        temperature=temperature
+                    )
+                logger.info("   ✓ %s (%d words)", section, _count_words(content))
+                return section, content
+
+        tasks = [asyncio.create_task(_generate_one(s)) for s in sections]
+        results = await asyncio.gather(*tasks)
+
+        # gather preserves task order, so sections stay in template order
+        return dict(results)
+
     def refine_with_chat(
         self,
         user_prompt: str,
@@ -68,72 +419,162 @@ class ContentGenerator:
         """
         MAIN CHAT HANDLER - Ultra smart with NLP
         """
-        print(f"\n💬 Chat Request: {user_prompt}")
-        
-        intent = self._detect_intent(user_prompt, current_sections)
-        print(f"   🧠 Detected Intent: {intent}")
-        
+        logger.info("💬 Chat Request: %s", user_prompt)
+
+        # Lowercase once here; every helper below takes it as a parameter
+        # instead of re-allocating its own lowered copy of the prompt
+        prompt_lower = user_prompt.lower()
+
+        # Semantic cache: same instruction (modulo wording) against the
+        # same document state returns the previous result instantly
+        norm_prompt = self._normalize_instruction(prompt_lower)
+        fingerprint = self._sections_fingerprint(current_sections)
+        cached = self._chat_cache_lookup(norm_prompt, fingerprint)
+        if cached is not None:
+            logger.info("   ⚡ Chat cache hit")
+            response_text, updated_sections = cached
+            return response_text, dict(updated_sections)
+
+        # One NLU pass: the parse carries the dispatch intent and is handed
+        # to the modification handler so nothing rescans the prompt
+        request = self._parse_user_request(user_prompt, current_sections, prompt_lower)
+        intent = request['chat_intent']
+        logger.info("   🧠 Detected Intent: %s", intent)
+
         if intent == "add_section":
-            return self._handle_add_section(user_prompt, current_sections, topic, subject)
+            result = self._handle_add_section(user_prompt, current_sections, topic, subject, prompt_lower)
         elif intent == "delete_section":
-            return self._handle_delete_section(user_prompt, current_sections)
+            result = self._handle_delete_section(user_prompt, current_sections, prompt_lower)
         elif intent == "modify_content":
-            return self._handle_content_modification(user_prompt, current_sections, topic, subject)
+            result = self._handle_content_modification(
+                user_prompt, current_sections, topic, subject, prompt_lower, parsed=request
+            )
         elif intent == "general_question":
-            return self._handle_general_question(user_prompt, current_sections, topic, subject)
+            result = self._handle_general_question(user_prompt, current_sections, topic, subject)
         else:
             return "I'm not sure what you want to do. Please try rephrasing.", {}
+
+        self._chat_cache_store(norm_prompt, fingerprint, result)
+        return result
     
-    def _detect_intent(self, user_prompt: str, current_sections: Dict[str, str]) -> str:
-        """Detect user's intent from prompt"""
-        prompt_lower = user_prompt.lower()
-        
-        if any(kw in prompt_lower for kw in ['add', 'insert', 'include', 'create new']):
+    @functools.lru_cache(maxsize=256)
+    def _detect_intent(self, prompt_lower: str) -> str:
+        """Detect user's intent from the (already lowercased) prompt
+
+        lru_cached: repeated/retried prompts skip the regex scans."""
+        if _ADD_INTENT_RE.search(prompt_lower):
             return "add_section"
-        
-        if any(kw in prompt_lower for kw in ['remove', 'delete', 'drop']):
+
+        if _DELETE_INTENT_RE.search(prompt_lower):
             return "delete_section"
-        
-        if any(kw in prompt_lower for kw in [
-            'change', 'modify', 'rewrite', 'expand', 'shorten', 'improve',
-            'make', 'keep', 'reduce', 'increase', 'words', 'references'
-        ]):
+
+        if _MODIFY_INTENT_RE.search(prompt_lower):
             return "modify_content"
-        
+
         return "general_question"
     
-    def _detect_target_sections(self, user_prompt: str, current_sections: Dict[str, str]) -> List[str]:
-        """Detect which sections user is referring to"""
-        prompt_lower = user_prompt.lower()
-        
-        if any(kw in prompt_lower for kw in ['all', 'everything', 'entire', 'whole']):
-            return list(current_sections.keys())
-        
-        target_sections = []
-        for section_name in current_sections.keys():
-            section_lower = section_name.lower()
-            
-            if section_lower in prompt_lower:
-                target_sections.append(section_name)
-                continue
-            
-            section_words = section_lower.split()
-            if any(word in prompt_lower for word in section_words if len(word) > 3):
-                target_sections.append(section_name)
-        
-        if not target_sections:
-            for section_name in current_sections.keys():
-                if 'reference' not in section_name.lower():
-                    target_sections.append(section_name)
-                    break
-        
-        return target_sections
+    def _lowered_section_names(self, section_names: tuple) -> List[Tuple[str, str, List[str]]]:
+        """(name, name.lower(), long words) per section, lowercased once per
+        section-name set instead of once per chat turn"""
+        cached = self._lower_names_cache.get(section_names)
+        if cached is None:
+            cached = []
+            for name in section_names:
+                lower = name.lower()
+                cached.append((name, lower, [w for w in lower.split() if len(w) > 3]))
+            self._lower_names_cache[section_names] = cached
+            if len(self._lower_names_cache) > 16:
+                self._lower_names_cache.popitem(last=False)
+        else:
+            self._lower_names_cache.move_to_end(section_names)
+        return cached
+
+    def _section_matcher(self, section_names: tuple):
+        """Compiled alternation over section names and their long words.
+
+        One C-level scan of the prompt replaces a substring search per
+        section (the classic multi-pattern/trie rewrite); each matched
+        term maps back to the sections it belongs to. Longer terms are
+        ordered first so full names win over their constituent words."""
+        entry = self._matcher_cache.get(section_names)
+        if entry is None:
+            term_map = {}
+            for name in section_names:
+                lower = name.lower()
+                term_map.setdefault(lower, set()).add(name)
+                for word in lower.split():
+                    if len(word) > 3:
+                        term_map.setdefault(word, set()).add(name)
+            if term_map:
+                # \b anchors keep 'intro' from firing inside 'introspection'
+                pattern = re.compile('|'.join(
+                    r'\b' + re.escape(term) + r'\b'
+                    for term in sorted(term_map, key=len, reverse=True)
+                ))
+            else:
+                pattern = None
+            entry = (pattern, term_map)
+            self._matcher_cache[section_names] = entry
+            if len(self._matcher_cache) > 16:
+                self._matcher_cache.popitem(last=False)
+        else:
+            self._matcher_cache.move_to_end(section_names)
+        return entry
+
+    def _detect_target_sections(
+        self,
+        user_prompt: str,
+        current_sections: Dict[str, str],
+        prompt_lower: str = None
+    ) -> List[str]:
+        """Detect which sections user is referring to
+
+        Memoized per (prompt, section-name set) since both the intent
+        dispatcher and the modification handlers ask the same question
+        within one chat turn."""
+        if prompt_lower is None:
+            prompt_lower = user_prompt.lower()
+        section_names = tuple(current_sections.keys())
+
+        cache_key = (prompt_lower, section_names)
+        cached = self._target_sections_cache.get(cache_key)
+        if cached is not None:
+            self._target_sections_cache.move_to_end(cache_key)
+            return list(cached)
+
+        if _ALL_SECTIONS_RE.search(prompt_lower):
+            target_sections = list(section_names)
+        else:
+            pattern, term_map = self._section_matcher(section_names)
+            hits = set()
+            if pattern is not None:
+                for match in pattern.finditer(prompt_lower):
+                    hits.update(term_map[match.group(0)])
+            target_sections = [name for name in section_names if name in hits]
+
+            if not target_sections:
+                for section_name, section_lower, _ in self._lowered_section_names(section_names):
+                    if 'reference' not in section_lower:
+                        target_sections.append(section_name)
+                        break
+
+        self._target_sections_cache[cache_key] = target_sections
+        if len(self._target_sections_cache) > 64:
+            self._target_sections_cache.popitem(last=False)
+
+        return list(target_sections)
     
     # ========================================
     # NATURAL LANGUAGE UNDERSTANDING
     # ========================================
     
-    def _extract_number_from_prompt(self, user_prompt: str, context: str = "words") -> Optional[int]:
+    @functools.lru_cache(maxsize=256)
+    def _extract_number_from_prompt(
+        self,
+        user_prompt: str,
+        context: str = "words",
+        prompt_lower: str = None
+    ) -> Optional[int]:
         """
         Extract number from user prompt with context awareness
         Handles:
@@ -143,40 +584,66 @@ class ContentGenerator:
         - "keep 45 references"
         - "write 500"
         """
-        prompt_lower = user_prompt.lower()
-        
-        if context == "words":
-            match = re.search(r'(\d+)\s*words?', prompt_lower)
-            if match:
-                return int(match.group(1))
-        
+        # Most chat prompts carry no number at all - one C-level scan
+        # short-circuits the regex machinery in that common case
+        if not any(ch.isdigit() for ch in user_prompt):
+            return None
+
+        if prompt_lower is None:
+            prompt_lower = user_prompt.lower()
+
+        # One pass over the prompt, remembering where each pattern first fired
+        first = {}
+        for match in _NUMBER_SCAN_RE.finditer(prompt_lower):
+            for name, value in match.groupdict().items():
+                if value is not None and name not in first:
+                    first[name] = (match.start(), int(value))
+
+        if not first:
+            return None
+
+        if context == "words" and 'words' in first:
+            return first['words'][1]
+
         if context == "references":
-            match = re.search(r'to\s+(?:only\s+)?(\d+)', prompt_lower)
-            if match:
-                return int(match.group(1))
-            
-            match = re.search(r'(?:keep\s+)?(\d+)\s+references?', prompt_lower)
-            if match:
-                return int(match.group(1))
-        
-        match = re.search(r'in\s+(\d+)', prompt_lower)
-        if match:
-            return int(match.group(1))
-        
-        match = re.search(r'(?:to|make|change|rewrite|expand|write|keep)\s+(?:only\s+)?(\d+)', prompt_lower)
-        if match:
-            return int(match.group(1))
-        
+            if 'refs_to' in first:
+                return first['refs_to'][1]
+            if 'keep_refs' in first:
+                return first['keep_refs'][1]
+
+        if 'in_n' in first:
+            return first['in_n'][1]
+
+        # Generic verb-number fallback: earliest of the remaining hits
+        candidates = [first[n] for n in ('refs_to', 'keep_refs', 'verb') if n in first]
+        if candidates:
+            return min(candidates)[1]
+
         return None
     
-    def _parse_user_request(self, user_prompt: str, current_sections: Dict[str, str]) -> Dict:
+    def _parse_user_request(
+        self,
+        user_prompt: str,
+        current_sections: Dict[str, str],
+        prompt_lower: str = None
+    ) -> Dict:
         """
         Advanced NLP parser for user requests
         Returns structured information about the request
         """
-        prompt_lower = user_prompt.lower()
-        
-        target_sections = self._detect_target_sections(user_prompt, current_sections)
+        if prompt_lower is None:
+            prompt_lower = user_prompt.lower()
+
+        # Retried prompts against the same section set reuse the parse
+        cache_key = (prompt_lower, tuple(current_sections.keys()))
+        cached = self._parse_cache.get(cache_key)
+        if cached is not None:
+            self._parse_cache.move_to_end(cache_key)
+            result = dict(cached)
+            result['target_sections'] = list(cached['target_sections'])
+            return result
+
+        target_sections = self._detect_target_sections(user_prompt, current_sections, prompt_lower)
         
         is_reference_request = any(
             'reference' in section.lower() 
@@ -184,22 +651,25 @@ class ContentGenerator:
         ) or 'reference' in prompt_lower
         
         if is_reference_request:
-            requested_number = self._extract_number_from_prompt(user_prompt, context="references")
+            requested_number = self._extract_number_from_prompt(user_prompt, "references", prompt_lower)
             number_type = "references"
         else:
-            requested_number = self._extract_number_from_prompt(user_prompt, context="words")
+            requested_number = self._extract_number_from_prompt(user_prompt, "words", prompt_lower)
             number_type = "words"
         
-        is_expansion = any(kw in prompt_lower for kw in [
-            'expand', 'longer', 'more details', 'add more', 'elaborate', 'increase'
-        ])
-        
-        is_reduction = any(kw in prompt_lower for kw in [
-            'shorten', 'reduce', 'shorter', 'decrease', 'concise', 'brief', 'less'
-        ])
-        
-        is_keep = 'keep' in prompt_lower
-        
+        # One tagged scan instead of three keyword sweeps
+        is_expansion = is_reduction = is_keep = False
+        for match in _ACTION_RE.finditer(prompt_lower):
+            group = match.lastgroup
+            if group == 'exp':
+                is_expansion = True
+            elif group == 'red':
+                is_reduction = True
+            else:
+                is_keep = True
+            if is_expansion and is_reduction and is_keep:
+                break
+
         if requested_number:
             intent = "specific_target"
         elif is_expansion:
@@ -211,14 +681,21 @@ class ContentGenerator:
         else:
             intent = "modify"
         
-        return {
+        result = {
             'target_sections': target_sections,
             'requested_number': requested_number,
             'number_type': number_type,
             'is_reference_request': is_reference_request,
             'intent': intent,
+            'chat_intent': self._detect_intent(prompt_lower),
             'original_prompt': user_prompt
         }
+
+        self._parse_cache[cache_key] = dict(result)
+        if len(self._parse_cache) > 256:
+            self._parse_cache.popitem(last=False)
+
+        return result
     
     # ========================================
     # CONTENT MODIFICATION HANDLER (ULTRA SMART)
@@ -229,7 +706,9 @@ class ContentGenerator:
         user_prompt: str,
         current_sections: Dict[str, str],
         topic: str,
-        subject: str
+        subject: str,
+        prompt_lower: str = None,
+        parsed: Dict = None
     ) -> Tuple[str, Dict[str, str]]:
         """
         ULTRA-SMART content modification handler
@@ -241,13 +720,15 @@ class ContentGenerator:
         - "Rewrite introduction to 150 words"
         """
         
-        request = self._parse_user_request(user_prompt, current_sections)
+        request = parsed if parsed is not None else self._parse_user_request(
+            user_prompt, current_sections, prompt_lower
+        )
         
-        print(f"\n  🧠 Parsed Request:")
-        print(f"     Target: {request['target_sections']}")
-        print(f"     Intent: {request['intent']}")
+        logger.info("  🧠 Parsed Request:")
+        logger.info("     Target: %s", request['target_sections'])
+        logger.info("     Intent: %s", request['intent'])
         if request['requested_number']:
-            print(f"     Target: {request['requested_number']} {request['number_type']}")
+            logger.info("     Target: %d %s", request['requested_number'], request['number_type'])
         
         if request['requested_number']:
             if request['number_type'] == "references":
@@ -267,15 +748,36 @@ class ContentGenerator:
             target_count = None
         
         updated_sections = {}
-        
-        for section_name in request['target_sections']:
-            if section_name not in current_sections:
-                continue
-            
-            print(f"  🔄 Processing {section_name}...")
-            
+        updated_metrics = {}
+
+        # Multi-section rewrites go out as ONE batched call: the shared
+        # instruction/topic tokens are sent (and billed) once instead of
+        # once per section, and wall time drops to a single round trip
+        batch_candidates = [
+            s for s in request['target_sections']
+            if s in current_sections and not (request['is_reference_request'] and target_count)
+        ]
+        if len(batch_candidates) > 1:
+            batched = self._batch_regenerate_sections(
+                section_names=batch_candidates,
+                current_sections=current_sections,
+                user_instruction=user_prompt,
+                topic=topic,
+                subject=subject,
+                max_words=max_words
+            )
+            if batched is not None:
+                updated_sections.update(batched)
+
+        remaining = [
+            name for name in request['target_sections']
+            if name in current_sections and name not in updated_sections
+        ]
+
+        def _regenerate_one(section_name: str) -> Tuple[str, str]:
+            logger.info("  🔄 Processing %s...", section_name)
             current_content = current_sections[section_name]
-            
+
             if request['is_reference_request'] and target_count:
                 new_content = self._regenerate_references(
                     section_name=section_name,
@@ -293,26 +795,44 @@ class ContentGenerator:
                     subject=subject,
                     max_words=max_words
                 )
-            
+            return section_name, new_content
+
+        # The remaining regenerations (batch fallback, reference changes)
+        # are independent HTTP calls - overlap them the same way
+        # generate_full_assignment does; map() keeps target order
+        if len(remaining) > 1:
+            with ThreadPoolExecutor(max_workers=min(6, len(remaining))) as executor:
+                results = list(executor.map(_regenerate_one, remaining))
+        else:
+            results = [_regenerate_one(name) for name in remaining]
+
+        for section_name, new_content in results:
             updated_sections[section_name] = new_content
-            
+
+            # Computed once here, reused by the summary loop below
             if request['is_reference_request']:
-                ref_count = len([line for line in new_content.split('\n') if re.match(r'^\d+\.', line.strip())])
-                print(f"  ✓ Modified {section_name} ({ref_count} references)")
+                updated_metrics[section_name] = len(_REF_COUNT_RE.findall(new_content))
+                logger.info("  ✓ Modified %s (%d references)", section_name, updated_metrics[section_name])
             else:
-                word_count = len(new_content.split())
-                print(f"  ✓ Modified {section_name} ({word_count} words)")
+                updated_metrics[section_name] = _count_words(new_content)
+                logger.info("  ✓ Modified %s (%d words)", section_name, updated_metrics[section_name])
         
         if updated_sections:
-            response = f"✅ Modified {len(updated_sections)} section(s):\n"
-            for sec in updated_sections.keys():
+            # List-append + join keeps this O(N) on any interpreter
+            # (repeated str += is quadratic in the worst case)
+            parts = [f"✅ Modified {len(updated_sections)} section(s):\n"]
+            for sec, content in updated_sections.items():
                 if request['is_reference_request']:
-                    ref_count = len([line for line in updated_sections[sec].split('\n') if re.match(r'^\d+\.', line.strip())])
-                    response += f"  - {sec} ({ref_count} references)\n"
+                    metric = updated_metrics.get(sec)
+                    if metric is None:
+                        metric = len(_REF_COUNT_RE.findall(content))
+                    parts.append(f"  - {sec} ({metric} references)\n")
                 else:
-                    word_count = len(updated_sections[sec].split())
-                    response += f"  - {sec} ({word_count} words)\n"
-            return response, updated_sections
+                    metric = updated_metrics.get(sec)
+                    if metric is None:
+                        metric = _count_words(content)
+                    parts.append(f"  - {sec} ({metric} words)\n")
+            return ''.join(parts), updated_sections
         else:
             return "No sections were modified.", {}
     
@@ -328,42 +848,26 @@ class ContentGenerator:
         """
         if not content:
             return content
-        
-        lines = content.split('\n')
+
+        # Bracket prefixes are rewritten across the whole string at once,
+        # then one MULTILINE scan yields the stripped non-empty lines -
+        # no intermediate line list or per-line strip copies
+        content = _BRACKET_NUM_RE.sub(r'\1. ', content)
+
         cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            
-            if not line:
-                continue
-            
+
+        for match in _NONEMPTY_LINE_RE.finditer(content):
+            line = match.group(1)
+
             # Skip AI introductory phrases
-            skip_phrases = [
-                'here are',
-                'here is',
-                'i have generated',
-                'below are',
-                'following are',
-                'in ieee style',
-                'in apa style',
-                'for an ai assignment',
-                'about "',
-                'references:',
-                'bibliography:'
-            ]
-            
-            if any(phrase in line.lower() for phrase in skip_phrases):
+            if _SKIP_PHRASE_RE.search(line.lower()):
                 continue
-            
-            # Convert [X] to X.
-            line = re.sub(r'^\[(\d+)\]\s*', r'\1. ', line)
-            
+
             # Keep lines that start with numbers or are continuations
-            if re.match(r'^\d+\.', line) or (cleaned_lines and not line.startswith(('1', '2', '3', '4', '5', '6', '7', '8', '9', '['))):
+            if _REF_LINE_RE.match(line) or (cleaned_lines and line[0] not in _REF_START_CHARS):
                 cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines).strip()
+
+        return '\n'.join(cleaned_lines)
     
     # ========================================
     # REFERENCE GENERATION (UPDATED IN v6.2)
@@ -378,18 +882,12 @@ class ContentGenerator:
         target_count: int
     ) -> str:
         """Generate references section with specific count"""
-        prompt = f"""Generate EXACTLY {target_count} academic references for a {subject} assignment about "{topic}".
-
-CRITICAL FORMAT REQUIREMENTS:
-- Use simple numbered format: 1., 2., 3. (NOT [1], [2], [3])
-- DO NOT include any introductory text like "Here are X references"
-- Start directly with reference number 1
-- Format: 1. Author, A., "Title," Journal, Vol. X, pp. XX-YY, Year.
-
-Generate EXACTLY {target_count} references now:"""
+        prompt = PROMPT_TEMPLATES['regenerate_references'].format(
+            target_count=target_count, subject=subject, topic=topic
+        )
 
         try:
-            response = self.groq.generate_text(
+            response = self._generate_cached(
                 prompt=prompt,
                 temperature=0.7,
                 max_tokens=2000
@@ -398,51 +896,128 @@ Generate EXACTLY {target_count} references now:"""
             cleaned = self._clean_reference_content(response)
             
             # Validate count
-            ref_lines = [l for l in cleaned.split('\n') if re.match(r'^\d+\.', l.strip())]
-            
-            if len(ref_lines) != target_count:
-                print(f"    ⚠️ Got {len(ref_lines)} refs instead of {target_count}")
-                if len(ref_lines) > target_count:
+            ref_count = len(_REF_COUNT_RE.findall(cleaned))
+
+            if ref_count != target_count:
+                logger.warning("    ⚠️ Got %d refs instead of %d", ref_count, target_count)
+                if ref_count > target_count:
                     cleaned = '\n'.join([l for l in cleaned.split('\n') if l.strip()][:target_count])
             
             return cleaned
             
         except Exception as e:
-            print(f"    ⚠️ Error: {e}")
+            logger.warning("    ⚠️ Error: %s", e)
             return current_content
     
+    def _references_prompt(self, count: int) -> str:
+        """Build the prompt for initial reference generation
+        (assignment context lives in the shared system preamble)"""
+        return PROMPT_TEMPLATES['references'].format(count=count)
+
     def _generate_references(self, topic: str, subject: str, count: int = 5) -> str:
         """Generate references for initial document"""
-        prompt = f"""Generate EXACTLY {count} academic references for a {subject} assignment about "{topic}".
-
-CRITICAL FORMAT REQUIREMENTS:
-- Use simple numbered format: 1., 2., 3. (NOT [1], [2], [3])
-- DO NOT include any introductory text
-- DO NOT say "Here are references" or similar
-- Start directly with reference 1
-- Format: 1. Author, A., "Title," Journal, Vol. X, pp. XX-YY, Year.
-
-Generate {count} references now:"""
+        prompt = self._references_prompt(count)
 
         try:
-            response = self.groq.generate_text(
+            response = self._generate_cached(
                 prompt=prompt,
                 temperature=0.7,
-                max_tokens=1500
+                max_tokens=1500,
+                system=self._assignment_preamble(topic, subject)
             )
             
             cleaned = self._clean_reference_content(response)
             
             return cleaned if cleaned else self._generate_fallback_references(topic, count)
-            
+
         except Exception as e:
-            print(f"⚠️ Error: {e}")
+            logger.warning("⚠️ Error: %s", e)
             return self._generate_fallback_references(topic, count)
-    
+
+    async def _agenerate_references(self, topic: str, subject: str, count: int = 5) -> str:
+        """Generate references for initial document (async variant)"""
+        prompt = self._references_prompt(count)
+
+        try:
+            response = await self.groq.agenerate_text(
+                prompt=prompt,
+                temperature=0.7,
+                max_tokens=1500,
+                system=self._assignment_preamble(topic, subject)
+            )
+
+            cleaned = self._clean_reference_content(response)
+
+            return cleaned if cleaned else self._generate_fallback_references(topic, count)
+
+        except Exception as e:
+            logger.warning("⚠️ Error: %s", e)
+            return self._generate_fallback_references(topic, count)
+
     # ========================================
     # SECTION GENERATION & REGENERATION
     # ========================================
     
+    def _batch_regenerate_sections(
+        self,
+        section_names: List[str],
+        current_sections: Dict[str, str],
+        user_instruction: str,
+        topic: str,
+        subject: str,
+        max_words: Optional[int] = None
+    ) -> Optional[Dict[str, str]]:
+        """
+        Rewrite several sections in ONE Groq call.
+
+        The model returns a JSON object mapping section name to new
+        content. Returns None when the call or the JSON parse fails,
+        so the caller can fall back to per-section regeneration.
+        """
+        word_limit_instruction = (
+            f"\nWrite EXACTLY {max_words} words per section." if max_words else ""
+        )
+        sections_block = "\n---\n".join(
+            f"{name}:\n{current_sections[name]}" for name in section_names
+        )
+        prompt = PROMPT_TEMPLATES['batch_rewrite'].format(
+            count=len(section_names),
+            subject=subject,
+            topic=topic,
+            user_instruction=user_instruction,
+            word_limit_instruction=word_limit_instruction,
+            sections_block=sections_block
+        )
+
+        try:
+            response = self._generate_cached(
+                prompt=prompt,
+                temperature=0.7,
+                max_tokens=min(6000, max(500, (max_words or 150) * 2) * len(section_names))
+            )
+
+            # Tolerate code fences or stray prose around the JSON object
+            start = response.find('{')
+            end = response.rfind('}')
+            if start == -1 or end <= start:
+                raise ValueError("no JSON object in response")
+            parsed = json.loads(response[start:end + 1])
+
+            updated = {
+                name: str(parsed[name]).strip()
+                for name in section_names
+                if parsed.get(name)
+            }
+            if not updated:
+                raise ValueError("JSON response covered no requested sections")
+
+            logger.info("  ⚡ Batched rewrite: %d/%d section(s) in one call", len(updated), len(section_names))
+            return updated
+
+        except Exception as e:
+            logger.warning("  ⚠️ Batch rewrite failed (%s), falling back to per-section calls", e)
+            return None
+
     def _regenerate_section_with_context(
         self,
         section_name: str,
@@ -454,39 +1029,44 @@ Generate {count} references now:"""
     ) -> str:
         """Regenerate section based on user instruction with word limit control"""
         word_limit_instruction = f"\n\nIMPORTANT: Write EXACTLY {max_words} words." if max_words else "\n\nWrite in detail with no word limit."
-        
-        prompt = f"""You are rewriting the "{section_name}" section of a {subject} assignment about "{topic}".
-
-Current content:
-{current_content}
 
-User wants: {user_instruction}
-
-Rewrite this section following the user's request.{word_limit_instruction}
-
-Write in proper paragraph format (not bullet points unless requested).
-Be specific and academic in tone."""
+        prompt = PROMPT_TEMPLATES['rewrite_section'].format(
+            section_name=section_name,
+            subject=subject,
+            topic=topic,
+            current_content=current_content,
+            user_instruction=user_instruction,
+            word_limit_instruction=word_limit_instruction
+        )
 
         try:
-            response = self.groq.generate_text(
+            response = self._generate_cached(
                 prompt=prompt,
                 temperature=0.7,
-                max_tokens=2000 if not max_words else max(500, max_words * 2)
+                max_tokens=2000 if not max_words else _tokens_for_words(max_words),
+                max_words=max_words
             )
             
             generated = response.strip()
             
             if max_words:
-                actual_words = len(generated.split())
+                actual_words = _count_words(generated)
                 if abs(actual_words - max_words) > max_words * 0.2:
-                    print(f"    ⚠️ Word count mismatch: {actual_words} vs {max_words} target")
+                    logger.warning("    ⚠️ Word count mismatch: %d vs %d target", actual_words, max_words)
             
             return generated
             
         except Exception as e:
-            print(f"    ⚠️ Error: {e}")
+            logger.warning("    ⚠️ Error: %s", e)
             return current_content
     
+    def _section_prompt(self, section_name: str, max_words: int) -> str:
+        """Build the prompt for initial section generation
+        (assignment context lives in the shared system preamble)"""
+        return PROMPT_TEMPLATES['section'].format(
+            section_name=section_name, max_words=max_words
+        )
+
     def _generate_section_content(
         self,
         section_name: str,
@@ -496,21 +1076,42 @@ Be specific and academic in tone."""
         temperature: float = 0.7
     ) -> str:
         """Generate content for a section"""
-        prompt = f"""Write the "{section_name}" section for a {subject} assignment about "{topic}".
+        prompt = self._section_prompt(section_name, max_words)
 
-Write EXACTLY {max_words} words.
-Use proper paragraph format (not bullet points).
-Be specific and academic."""
+        try:
+            response = self._generate_cached(
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=_tokens_for_words(max_words),
+                system=self._assignment_preamble(topic, subject),
+                max_words=max_words
+            )
+            return response.strip()
+        except Exception as e:
+            logger.warning("⚠️ Error: %s", e)
+            return self._generate_fallback(section_name, topic, max_words)
+
+    async def _agenerate_section_content(
+        self,
+        section_name: str,
+        topic: str,
+        subject: str,
+        max_words: int = 110,
+        temperature: float = 0.7
+    ) -> str:
+        """Generate content for a section (async variant)"""
+        prompt = self._section_prompt(section_name, max_words)
 
         try:
-            response = self.groq.generate_text(
+            response = await self.groq.agenerate_text(
                 prompt=prompt,
                 temperature=temperature,
-                max_tokens=500
+                max_tokens=_tokens_for_words(max_words),
+                system=self._assignment_preamble(topic, subject)
             )
             return response.strip()
         except Exception as e:
-            print(f"⚠️ Error: {e}")
+            logger.warning("⚠️ Error: %s", e)
             return self._generate_fallback(section_name, topic, max_words)
     
     # ========================================
@@ -522,19 +1123,17 @@ Be specific and academic."""
         user_prompt: str,
         current_sections: Dict[str, str],
         topic: str,
-        subject: str
+        subject: str,
+        prompt_lower: str = None
     ) -> Tuple[str, Dict[str, str]]:
         """Handle adding new section"""
-        prompt_lower = user_prompt.lower()
-        
-        for word in ['add', 'insert', 'include', 'create']:
-            if word in prompt_lower:
-                parts = prompt_lower.split(word, 1)
-                if len(parts) > 1:
-                    section_name = parts[1].strip().title()
-                    break
-        else:
-            section_name = "New Section"
+        if prompt_lower is None:
+            prompt_lower = user_prompt.lower()
+
+        # One scan-and-capture instead of substring test + split per verb;
+        # also keeps 'create new X' from losing the 'new' prefix
+        match = _ADD_NAME_RE.search(prompt_lower)
+        section_name = match.group('name').title() if match else "New Section"
         
         content = self._generate_section_content(section_name, topic, subject, max_words=110)
         
@@ -543,10 +1142,11 @@ Be specific and academic."""
     def _handle_delete_section(
         self,
         user_prompt: str,
-        current_sections: Dict[str, str]
+        current_sections: Dict[str, str],
+        prompt_lower: str = None
     ) -> Tuple[str, Dict[str, str]]:
         """Handle deleting section"""
-        target_sections = self._detect_target_sections(user_prompt, current_sections)
+        target_sections = self._detect_target_sections(user_prompt, current_sections, prompt_lower)
         
         deleted = {}
         for section in target_sections:
@@ -565,22 +1165,30 @@ Be specific and academic."""
         subject: str
     ) -> Tuple[str, Dict[str, str]]:
         """Handle general questions"""
-        sections_text = "\n\n".join([f"{name}:\n{content}" for name, content in current_sections.items()])
-        
-        prompt = f"""You are helping with a {subject} assignment about "{topic}".
-
-Current content:
-{sections_text}
-
-User question: {user_prompt}
-
-Provide a helpful response."""
+        # The document context goes in the SYSTEM message and is memoized
+        # per document state: repeated questions in a session skip the
+        # rebuild, and the identical prefix lets Groq cache it server-side.
+        # Snippets are capped - a question needs the gist, not every word.
+        cache_key = (topic, subject, self._sections_fingerprint(current_sections))
+        if self._general_context_cache and self._general_context_cache[0] == cache_key:
+            context = self._general_context_cache[1]
+        else:
+            sections_text = "\n\n".join(
+                f"{name}:\n{content[:300]}" for name, content in current_sections.items()
+            )
+            context = PROMPT_TEMPLATES['general_question'].format(
+                subject=subject,
+                topic=topic,
+                sections_text=sections_text
+            )
+            self._general_context_cache = (cache_key, context)
 
         try:
-            response = self.groq.generate_text(
-                prompt=prompt,
+            response = self._generate_cached(
+                prompt=user_prompt,
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=500,
+                system=context
             )
             return response.strip(), {}
         except Exception as e:
@@ -592,17 +1200,14 @@ Provide a helpful response."""
     
     def _generate_fallback(self, section_name: str, topic: str, max_words: int) -> str:
         """Fallback content generation"""
-        words = []
-        base_text = f"This section discusses {section_name.lower()} in the context of {topic}. "
-        
-        while len(words) < max_words:
-            words.extend(base_text.split())
-        
-        return ' '.join(words[:max_words])
+        # Split once, repeat by multiplication, slice to the target -
+        # no re-splitting the same sentence every loop iteration
+        tokens = _FALLBACK_TMPL(section=section_name.lower(), topic=topic).split()
+        return ' '.join((tokens * (max_words // len(tokens) + 1))[:max_words])
     
     def _generate_fallback_references(self, topic: str, count: int) -> str:
         """Fallback reference generation"""
-        refs = []
-        for i in range(1, count + 1):
-            refs.append(f"{i}. Author, A., \"Study on {topic},\" Journal Name, Vol. 1, pp. 1-10, 2024.")
-        return '\n'.join(refs)
+        return '\n'.join(
+            f"{i}. Author, A., \"Study on {topic},\" Journal Name, Vol. 1, pp. 1-10, 2024."
+            for i in range(1, count + 1)
+        )
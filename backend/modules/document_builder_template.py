@@ -9,13 +9,54 @@ Document Builder V24.0 - ULTIMATE ROBUST
 ✅ Proper page break
 """
 
+import copy
+import io
 import os
 import re
 from datetime import datetime
 from typing import Dict, List
+from lxml import etree
 from docx import Document
+from docx.oxml.ns import nsmap, qn
 from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
+from docx.text.paragraph import Paragraph
+
+
+# Compiled once: these run inside per-paragraph / per-reference loops,
+# where re's cache lookup and argument marshalling add up
+_NUMLIST_RE = re.compile(r'^\d+\.\s+\w+')
+_BULLET_RE = re.compile(r'^[•→★▸➤◆■\-●○]\s*')
+_NUMPREFIX_RE = re.compile(r'^\d+[\.\)\\]\s*')
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9]')
+
+# Compiled XPath: all the hot scans read "the text of this element", so
+# collect the <w:t> text nodes in one libxml2 evaluation instead of
+# building a Python generator over child elements per call
+_W_TEXTS_XP = etree.XPath('.//w:t/text()', namespaces={'w': nsmap['w']})
+
+
+def _element_text(el) -> str:
+    """Concatenated <w:t> text of an element (paragraph, cell, table)"""
+    return ''.join(_W_TEXTS_XP(el))
+
+
+# Warm parsed Documents by (path, mtime): serving deepcopies of an
+# already-parsed tree skips the unzip + XML tokenize entirely. Module
+# scope, not builder state: finalize pickles the builder into the
+# process pool per task, so an instance cache would ride over empty
+# and die with the task - and a parsed lxml tree on the instance
+# would make the builder unpicklable outright. A module global
+# persists for the life of each worker process instead.
+_TEMPLATE_DOC_CACHE = {}
+# Same key → raw template bytes: repeated builds from the same
+# uploaded template skip disk reads and unzip from RAM
+_TEMPLATE_BYTES_CACHE = {}
+# Same key → section list from analyze_template - the generate flow
+# analyzes the template it just uploaded, so the second look at an
+# unchanged file is a dict hit instead of a full ZIP+XML parse
+_ANALYZE_CACHE = {}
 
 
 class SmartDocumentBuilder:
@@ -24,20 +65,75 @@ class SmartDocumentBuilder:
     def __init__(self, ollama_url: str = "http://localhost:11434"):
         self.ollama_url = ollama_url
         print("✓ Document Builder initialized (V24 - ULTIMATE ROBUST)")
+
+
+    def _load_template(self, template_path: str) -> Document:
+        """Open a template Document, cloning a warm parsed tree when the
+        file on disk has not changed since the last build
+
+        Deep-copying an already-parsed Document is a tight C-level tree
+        clone - several times faster than re-unzipping and tokenizing the
+        XML. The cached base is never handed out directly, so callers can
+        mutate their copy freely; if a template ever refuses to deepcopy
+        we fall back to re-parsing the cached bytes.
+        """
+        try:
+            mtime = os.path.getmtime(template_path)
+            cache_key = (template_path, mtime)
+
+            base = _TEMPLATE_DOC_CACHE.get(cache_key)
+            if base is not None:
+                try:
+                    return copy.deepcopy(base)
+                except Exception:
+                    del _TEMPLATE_DOC_CACHE[cache_key]
+
+            if cache_key not in _TEMPLATE_BYTES_CACHE:
+                with open(template_path, "rb") as f:
+                    data = f.read()
+                # A finalize normally reuses one template; keep the cache tiny
+                if len(_TEMPLATE_BYTES_CACHE) >= 8:
+                    _TEMPLATE_BYTES_CACHE.clear()
+                _TEMPLATE_BYTES_CACHE[cache_key] = data
+
+            doc = Document(io.BytesIO(_TEMPLATE_BYTES_CACHE[cache_key]))
+
+            try:
+                clone = copy.deepcopy(doc)
+            except Exception:
+                return doc
+
+            if len(_TEMPLATE_DOC_CACHE) >= 4:
+                _TEMPLATE_DOC_CACHE.clear()
+            _TEMPLATE_DOC_CACHE[cache_key] = doc
+            return clone
+        except OSError:
+            return Document(template_path)
     
     
     def analyze_template(self, template_path: str) -> List[str]:
         """Analyze template for sections"""
         try:
-            doc = Document(template_path)
-            
+            try:
+                cache_key = (template_path, os.path.getmtime(template_path))
+            except OSError:
+                cache_key = None
+
+            if cache_key is not None and cache_key in _ANALYZE_CACHE:
+                return list(_ANALYZE_CACHE[cache_key])
+
+            doc = self._load_template(template_path)
+
             for table in doc.tables:
-                first_row = ' '.join([cell.text for cell in table.rows[0].cells]).lower()
-                
+                # Snapshot the header row once; both the membership check
+                # and the per-cell classification read from the same list
+                header_texts = self._row_texts(table._tbl.tr_lst[0])
+                first_row = ' '.join(header_texts).lower()
+
                 if ('objective' in first_row or 'descriptive' in first_row) and 'conclusion' in first_row:
                     sections = []
-                    for cell in table.rows[0].cells:
-                        text = cell.text.strip().replace('\n', ' ').split('(')[0].strip()
+                    for cell_text in header_texts:
+                        text = cell_text.strip().replace('\n', ' ').split('(')[0].strip()
                         if not text or len(text) < 2:
                             continue
                         text_lower = text.lower()
@@ -50,11 +146,24 @@ class SmartDocumentBuilder:
                             continue
                         sections.append(text)
                     sections.append('References')
+                    self._remember_analysis(cache_key, sections)
                     return sections
-            
-            return ['Objective', 'Context and Relevance', 'Technology aspects and relevant drawings', 'Emerging trends ideas you visualize in the field', 'Conclusion', 'References']
+
+            default = ['Objective', 'Context and Relevance', 'Technology aspects and relevant drawings', 'Emerging trends ideas you visualize in the field', 'Conclusion', 'References']
+            self._remember_analysis(cache_key, default)
+            return default
         except:
             return ['Objective', 'Context and Relevance', 'Technology aspects and relevant drawings', 'Emerging trends ideas you visualize in the field', 'Conclusion', 'References']
+
+
+    @staticmethod
+    def _remember_analysis(cache_key, sections: List[str]):
+        """Store an analysis result, keeping the cache tiny like the bytes cache"""
+        if cache_key is None:
+            return
+        if len(_ANALYZE_CACHE) >= 8:
+            _ANALYZE_CACHE.clear()
+        _ANALYZE_CACHE[cache_key] = list(sections)
     
     
     def generate_from_template(
@@ -68,9 +177,9 @@ class SmartDocumentBuilder:
         """Generate assignment - ULTIMATE ROBUST"""
         
         result = {'status': 'success', 'output_path': None}
-        
+
         try:
-            doc = Document(template_path)
+            doc = self._load_template(template_path)
             
             print(f"\n🔧 Step 1: Smart topic replacement...")
             topic_filled = self._fill_topic_smart(doc, topic)
@@ -80,18 +189,18 @@ class SmartDocumentBuilder:
                 print(f"   ⚠ Topic field not found")
             
             print(f"🗑️ Step 2: Smart content deletion...")
-            deleted = self._delete_content_smart(doc)
+            deleted, last_kept_p = self._delete_content_smart(doc)
             print(f"   ✅ Deleted {deleted} elements")
-            
+
             print(f"📄 Step 3: Adding page break...")
-            self._add_page_break_smart(doc)
+            self._add_page_break_smart(doc, last_kept_p)
             
             print(f"📝 Step 4: Adding our content on page 2...")
             self._add_content_page2(doc, topic, generated_content)
             
             # Save
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_name = "".join(c for c in user_data.get('name', 'Student') if c.isalnum())[:15]
+            safe_name = _SAFE_NAME_RE.sub('', user_data.get('name', 'Student'))[:15]
             if not safe_name:
                 safe_name = "Student"
             output_filename = f"Assignment_{safe_name}_{timestamp}.docx"
@@ -116,6 +225,17 @@ class SmartDocumentBuilder:
             return result
     
     
+    @staticmethod
+    def _row_texts(tr) -> List[str]:
+        """Snapshot every cell's text in a row with one lxml walk
+
+        Each python-docx cell.text access re-walks the <w:tc> subtree;
+        reading the raw <w:t> nodes once gives the same strings for the
+        price of a single C-level traversal.
+        """
+        return [_element_text(tc) for tc in tr.iter(qn('w:tc'))]
+
+
     def _fill_topic_smart(self, doc: Document, topic: str) -> bool:
         """
         ✅ Smart topic replacement - handles multiple formats:
@@ -128,18 +248,24 @@ class SmartDocumentBuilder:
         
         # Keywords to identify topic rows
         topic_keywords = ['Assignment Topic', 'Title of Journal Paper', 'Journal Paper']
-        
+
         for table_idx, table in enumerate(doc.tables):
-            for row_idx, row in enumerate(table.rows):
-                for cell in row.cells:
-                    cell_text = cell.text.strip()
-                    
+            # One pass over the table's raw <w:t> nodes first: tables
+            # without any keyword are skipped before a single row/cell
+            # wrapper object is built (each cell.text re-walks its subtree)
+            table_text = _element_text(table._tbl)
+            if not any(keyword in table_text for keyword in topic_keywords):
+                continue
+
+            rows = table.rows
+            for row_idx, row in enumerate(rows):
+                for cell_text in self._row_texts(row._tr):
                     # Check if this cell contains topic keyword
                     for keyword in topic_keywords:
                         if keyword in cell_text:
                             # Found topic row! Next row contains the topic cell
-                            if row_idx + 1 < len(table.rows):
-                                topic_row = table.rows[row_idx + 1]
+                            if row_idx + 1 < len(rows):
+                                topic_row = rows[row_idx + 1]
                                 topic_cell = topic_row.cells[0]
                                 
                                 # Clear the cell
@@ -167,106 +293,169 @@ class SmartDocumentBuilder:
         return False
     
     
-    def _delete_content_smart(self, doc: Document) -> int:
+    def _delete_content_smart(self, doc: Document) -> tuple:
         """
         ✅ Smart content deletion:
         1. If COURSE TEACHER SIGNATURE found: Delete everything AFTER it
         2. If "Type Your Heading Here" found: Delete from there onwards
         3. If numbered list (1. 2. 3...) found: Delete from there onwards
         4. Otherwise: Don't delete anything (clean template)
+
+        Returns (deleted_count, last_kept_p) where last_kept_p is the
+        last surviving non-empty <w:p> element (or None) - the scan
+        already knows it, so the page-break step doesn't have to walk
+        every paragraph again to find it.
         """
         
         try:
-            paragraphs = list(doc.paragraphs)
+            # Direct body children only (the same set doc.paragraphs
+            # exposes), read through raw lxml so each paragraph's text
+            # is extracted exactly once - the old loop re-walked the
+            # <w:p> subtree on every .text access, up to three per hit
+            body = doc.element.body
+            p_elements = body.findall(qn('w:p'))
+            texts = [_element_text(p_el).strip() for p_el in p_elements]
+
             deletion_start_idx = None
             deletion_reason = None
-            
+
             # Find deletion starting point
-            for idx, para in enumerate(paragraphs):
-                para_text = para.text.strip()
-                
+            for idx, para_text in enumerate(texts):
+                upper = para_text.upper()
+
                 # Strategy 1: Delete after COURSE TEACHER SIGNATURE
-                if 'COURSE TEACHER' in para_text.upper() or 'SIGNATURE' in para_text.upper():
+                if 'COURSE TEACHER' in upper or 'SIGNATURE' in upper:
                     # Look for next 3 paragraphs for instructor name
-                    for j in range(idx + 1, min(idx + 4, len(paragraphs))):
-                        next_text = paragraphs[j].text.strip()
+                    for j in range(idx + 1, min(idx + 4, len(texts))):
+                        next_text = texts[j]
                         if 'Mrs.' in next_text or 'Mr.' in next_text or 'Dr.' in next_text:
                             # Delete AFTER instructor name
                             deletion_start_idx = j + 1
                             deletion_reason = f"after COURSE TEACHER SIGNATURE ({next_text})"
                             break
-                    
+
                     if deletion_start_idx:
                         break
-                
+
                 # Strategy 2: Delete from "Type Your Heading Here"
-                if 'Type Your Heading' in para_text or 'type your heading' in para_text.lower():
+                if 'type your heading' in para_text.lower():
                     deletion_start_idx = idx
                     deletion_reason = "'Type Your Heading Here' placeholder"
                     break
-                
+
                 # Strategy 3: Delete numbered list (but not if it's in first 10 paragraphs - those are headers)
-                if idx > 10 and re.match(r'^\d+\.\s+\w+', para_text):
+                if idx > 10 and _NUMLIST_RE.match(para_text):
                     if deletion_start_idx is None:
                         deletion_start_idx = idx
                         deletion_reason = f"numbered list starting with '{para_text[:30]}'"
-            
+
             # Perform deletion
             if deletion_start_idx is not None:
-                paragraphs_to_delete = paragraphs[deletion_start_idx:]
-                for para in paragraphs_to_delete:
-                    p = para._element
-                    p.getparent().remove(p)
-                
+                to_delete = p_elements[deletion_start_idx:]
+                last_kept = self._last_nonempty(p_elements, texts, deletion_start_idx)
+
+                if to_delete:
+                    parent = to_delete[0].getparent()
+                    start = parent.index(to_delete[0])
+                    end = parent.index(to_delete[-1]) + 1
+                    if parent is body and end - start == len(to_delete):
+                        # Contiguous tail siblings (nothing like a table
+                        # between them): one libxml2 slice unlink instead
+                        # of N O(siblings) remove() calls; the trailing
+                        # sectPr sits past `end` and is untouched
+                        del parent[start:end]
+                    else:
+                        for p_el in to_delete:
+                            p_el.getparent().remove(p_el)
+
                 print(f"   ℹ Deleted from {deletion_reason}")
-                return len(paragraphs_to_delete)
+                return len(to_delete), last_kept
             else:
                 print(f"   ℹ No placeholder content found (clean template)")
-                return 0
-            
+                return 0, self._last_nonempty(p_elements, texts, len(texts))
+
         except Exception as e:
             print(f"   ⚠ Deletion error: {e}")
-            return 0
+            return 0, None
+
+
+    @staticmethod
+    def _last_nonempty(p_elements, texts, end):
+        """Last <w:p> before index `end` whose text is non-empty"""
+        for k in range(end - 1, -1, -1):
+            if texts[k]:
+                return p_elements[k]
+        return None
     
     
-    def _add_page_break_smart(self, doc: Document):
-        """Add proper page break"""
-        
+    def _add_page_break_smart(self, doc: Document, last_p=None):
+        """Add proper page break
+
+        When the deletion step already identified the last surviving
+        non-empty paragraph it is passed in directly; the full reversed
+        scan only runs as a fallback.
+        """
+
         try:
+            if last_p is not None and last_p.getparent() is not None:
+                run = Paragraph(last_p, doc._body).add_run()
+                run.add_break(WD_BREAK.PAGE)
+                print(f"   ✓ Page break added")
+                return
+
             paragraphs = doc.paragraphs
             if paragraphs:
                 # Find last non-empty paragraph
                 last_para = None
                 for para in reversed(paragraphs):
-                    if para.text.strip():
+                    if _element_text(para._p).strip():
                         last_para = para
                         break
-                
+
                 if last_para is None:
-                    last_para = paragraphs[-1] if paragraphs else None
-                
-                if last_para:
-                    # Add page break
-                    run = last_para.add_run()
-                    run.add_break(type=6)  # Page break
-                    print(f"   ✓ Page break added")
-                else:
-                    # Fallback
-                    doc.add_page_break()
-                    print(f"   ✓ Page break added (fallback)")
+                    last_para = paragraphs[-1]
+
+                # Add page break
+                run = last_para.add_run()
+                run.add_break(WD_BREAK.PAGE)
+                print(f"   ✓ Page break added")
             else:
                 doc.add_page_break()
                 print(f"   ✓ Page break added (no paragraphs)")
-                
+
         except Exception as e:
             print(f"   ⚠ Page break error: {e}")
             doc.add_page_break()
             print(f"   ✓ Page break added (error fallback)")
     
     
+    @staticmethod
+    def _ensure_styles(doc: Document):
+        """Define the body/reference paragraph styles once per document
+
+        Applying a named style writes a single <w:pStyle> reference per
+        paragraph instead of a full rPr on every run, so the per-run
+        formatting loops disappear and the saved XML is smaller.
+        """
+        styles = doc.styles
+        if 'KB Body' not in styles:
+            body = styles.add_style('KB Body', WD_STYLE_TYPE.PARAGRAPH)
+            body.font.name = 'Times New Roman'
+            body.font.size = Pt(12)
+            body.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+            body.paragraph_format.line_spacing = 1.15
+        if 'KB Ref' not in styles:
+            ref = styles.add_style('KB Ref', WD_STYLE_TYPE.PARAGRAPH)
+            ref.font.name = 'Times New Roman'
+            ref.font.size = Pt(12)
+            ref.paragraph_format.space_after = Pt(4)
+
+
     def _add_content_page2(self, doc: Document, topic: str, generated_content: Dict):
         """Add our content on page 2"""
-        
+
+        self._ensure_styles(doc)
+
         # Topic heading
         topic_para = doc.add_paragraph()
         run = topic_para.add_run(topic)
@@ -279,14 +468,17 @@ class SmartDocumentBuilder:
         
         print(f"   ✓ Topic heading")
         
-        # Sections
-        section_num = 1
-        total_sections = len([k for k in generated_content.keys() if generated_content[k].strip()])
-        
-        for section_name, content in generated_content.items():
-            if not content or len(content.strip()) < 10:
-                continue
-            
+        # Sections: strip and filter once up front - the loop and the
+        # between-section spacing check consume the same list instead of
+        # re-stripping every value on a second pass
+        sections = [
+            (name, content.strip())
+            for name, content in generated_content.items()
+            if content and len(content.strip()) >= 10
+        ]
+        total_sections = len(sections)
+
+        for section_num, (section_name, content) in enumerate(sections, 1):
             # Section heading
             heading_para = doc.add_paragraph()
             heading_run = heading_para.add_run(f"{section_num}. {section_name}")
@@ -300,47 +492,30 @@ class SmartDocumentBuilder:
             if 'reference' in section_name.lower():
                 self._add_references(doc, content)
             else:
-                para = doc.add_paragraph(content.strip())
-                self._format_para(para)
-            
+                doc.add_paragraph(content, style='KB Body')
+
             # Spacing between sections
             if section_num < total_sections:
                 doc.add_paragraph()
-            
+
             print(f"   ✓ Section {section_num}: {section_name}")
-            section_num += 1
-        
-        print(f"   ✅ Added {section_num - 1} sections")
-    
-    
-    def _format_para(self, para):
-        """Format paragraph"""
-        for run in para.runs:
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-        para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        para.paragraph_format.line_spacing = 1.15
+
+        print(f"   ✅ Added {total_sections} sections")
     
     
     def _add_references(self, doc: Document, content: str):
         """Add numbered references"""
         refs = [line.strip() for line in content.split('\n') if line.strip()]
-        
+
         ref_num = 1
         for ref in refs:
-            ref = re.sub(r'^[•→★▸➤◆■\-●○]\s*', '', ref)
-            ref = re.sub(r'^\d+[\.\)\\]\s*', '', ref)
-            
-            para = doc.add_paragraph(f"{ref_num}. {ref}")
-            
-            for run in para.runs:
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-            
-            para.paragraph_format.space_after = Pt(4)
-            
+            ref = _BULLET_RE.sub('', ref)
+            ref = _NUMPREFIX_RE.sub('', ref)
+
+            doc.add_paragraph(f"{ref_num}. {ref}", style='KB Ref')
+
             ref_num += 1
-        
+
         print(f"   ✓ {ref_num - 1} references")
     
     
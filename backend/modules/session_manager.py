@@ -3,28 +3,133 @@ Session Manager - FIXED VERSION
 ✅ Properly updates sections when chat modifies content
 ✅ Stores chat history
 ✅ Auto-cleanup of expired sessions
+✅ Optional Redis backend (set REDIS_URL) for horizontal scaling
 """
 
+import heapq
+import json
+import os
+import re
+import time
 import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 
 
+# Word counting: compiled once, no throwaway list per call
+_WORD_RE = re.compile(r'\S+')
+
+
+def _count_words(text: str) -> int:
+    """Count whitespace-separated words without materializing a list"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+
+@dataclass(slots=True)
+class Session:
+    """In-memory session record
+
+    Slotted fixed-layout storage instead of a ~11-key dict per session;
+    the mapping-style accessors keep existing callers (and the Redis
+    code path, which stays dict-based) working unchanged.
+    """
+
+    session_id: str
+    topic: str
+    subject: str
+    sections: Dict[str, str]
+    word_counts: Dict[str, int]
+    total_words: int
+    template_path: str
+    created_at: str
+    last_accessed: str
+    _created_ts: float
+    chat_history: list = field(default_factory=list)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
 class SessionManager:
-    """Manages user sessions for document generation"""
-    
-    def __init__(self, session_timeout_hours: int = 24):
+    """
+    Manages user sessions for document generation
+
+    Storage backends:
+    - In-memory dict (default) - single worker deployments
+    - Redis with per-session TTL - set REDIS_URL to share sessions
+      across workers/instances; expiry is handled by Redis itself
+    """
+
+    REDIS_PREFIX = "krishopus:session:"
+
+    def __init__(self, session_timeout_hours: int = 24, redis_url: str = None,
+                 max_sessions: int = 1000):
         """
         Initialize session manager
-        
+
         Args:
             session_timeout_hours: Hours before session expires (default: 24)
+            redis_url: Redis connection URL (defaults to REDIS_URL env var)
+            max_sessions: In-memory cap; least-recently-used sessions are
+                          evicted beyond this (Redis backend is unbounded)
         """
-        self.sessions = {}
+        # LRU order: accessed sessions move to the end, eviction pops the
+        # front - memory stays bounded even between cleanup sweeps
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
         self.session_timeout = timedelta(hours=session_timeout_hours)
-        print(f"✅ SessionManager initialized (timeout: {session_timeout_hours}h)")
-    
-    
+        self._ttl_seconds = session_timeout_hours * 3600
+        # Min-heap of (expiry_ts, session_id) for the in-memory backend:
+        # cleanup pops only the entries that are actually due instead of
+        # parsing every session's created_at timestamp
+        self._expiry_heap = []
+
+        self._redis = None
+        redis_url = redis_url or os.getenv("REDIS_URL")
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+                self._redis.ping()
+                print(f"✅ SessionManager initialized (Redis, TTL: {session_timeout_hours}h)")
+                return
+            except Exception as e:
+                print(f"⚠ Redis unavailable ({e}), falling back to in-memory sessions")
+                self._redis = None
+
+        print(f"✅ SessionManager initialized (in-memory, timeout: {session_timeout_hours}h)")
+
+
+    def _redis_key(self, session_id: str) -> str:
+        return f"{self.REDIS_PREFIX}{session_id}"
+
+
+    def _redis_sections_key(self, session_id: str) -> str:
+        # Sections live in their own hash so chat refinement can
+        # delta-write single fields instead of rewriting the whole session
+        return f"{self.REDIS_PREFIX}{session_id}:sections"
+
+
+    def _redis_save_meta(self, session: Dict):
+        """Persist session metadata (everything but sections), refreshing TTL"""
+        meta = {k: v for k, v in session.items() if k != "sections"}
+        session_id = session["session_id"]
+        self._redis.setex(
+            self._redis_key(session_id),
+            self._ttl_seconds,
+            json.dumps(meta)
+        )
+        self._redis.expire(self._redis_sections_key(session_id), self._ttl_seconds)
+
+
     def create_session(
         self,
         topic: str,
@@ -34,85 +139,157 @@ class SessionManager:
     ) -> str:
         """
         Create a new session
-        
+
         Args:
             topic: Assignment topic
             subject: Subject name
             sections: Generated content sections
             template_path: Path to template file
-        
+
         Returns:
             session_id: Unique session identifier
         """
         session_id = str(uuid.uuid4())
-        
-        self.sessions[session_id] = {
+
+        word_counts = {name: _count_words(str(content)) for name, content in sections.items()}
+        created_ts = time.time()
+        # One datetime + one format per create; the same string serves
+        # both timestamp fields
+        created_iso = datetime.now().isoformat()
+
+        session = {
             "session_id": session_id,
             "topic": topic,
             "subject": subject,
             "sections": sections,
+            "word_counts": word_counts,
+            "total_words": sum(word_counts.values()),
             "template_path": template_path,
-            "created_at": datetime.now().isoformat(),
-            "last_accessed": datetime.now().isoformat(),
+            "created_at": created_iso,
+            "last_accessed": created_iso,
+            "_created_ts": created_ts,
             "chat_history": []
         }
-        
+
+        if self._redis is not None:
+            if sections:
+                self._redis.hset(self._redis_sections_key(session_id), mapping=sections)
+            self._redis_save_meta(session)
+        else:
+            self.sessions[session_id] = Session(**session)
+            heapq.heappush(self._expiry_heap, (created_ts + self._ttl_seconds, session_id))
+            if len(self.sessions) > self.max_sessions:
+                evicted_id, _ = self.sessions.popitem(last=False)
+                print(f"⚠ Session cap reached, evicted LRU session: {evicted_id}")
+
         print(f"✅ Session created: {session_id}")
         return session_id
-    
-    
+
+
     def get_session(self, session_id: str) -> Optional[Dict]:
         """
         Get session by ID
-        
+
         Args:
             session_id: Session identifier
-        
+
         Returns:
             Session data or None if not found/expired
         """
+        if self._redis is not None:
+            raw = self._redis.get(self._redis_key(session_id))
+            if raw is None:
+                print(f"⚠ Session not found: {session_id}")
+                return None
+            session = json.loads(raw)
+            session["sections"] = self._redis.hgetall(self._redis_sections_key(session_id))
+            session["last_accessed"] = datetime.now().isoformat()
+            self._redis_save_meta(session)
+            return session
+
         if session_id not in self.sessions:
             print(f"⚠ Session not found: {session_id}")
             return None
-        
+
         session = self.sessions[session_id]
-        
-        # Check if expired
-        created_at = datetime.fromisoformat(session["created_at"])
-        if datetime.now() - created_at > self.session_timeout:
+
+        # Check if expired (float compare - no isoformat parse per access;
+        # the heap entry left behind is tolerated by cleanup's pop)
+        if time.time() - session["_created_ts"] > self._ttl_seconds:
             print(f"⚠ Session expired: {session_id}")
             del self.sessions[session_id]
             return None
-        
-        # Update last accessed time
+
+        # Update last accessed time and refresh LRU position
         session["last_accessed"] = datetime.now().isoformat()
-        
+        self.sessions.move_to_end(session_id)
+
         return session
-    
-    
-    def update_sections(self, session_id: str, updated_sections: Dict[str, str]):
+
+
+    def update_sections(
+        self,
+        session_id: str,
+        updated_sections: Dict[str, str]
+    ) -> Optional[Dict[str, int]]:
         """
         CRITICAL FIX: Update specific sections in session
         This is called when chat refinement modifies content
-        
+
         Args:
             session_id: Session identifier
             updated_sections: Dictionary of section_name: new_content
+
+        Returns:
+            New word counts for the updated sections (None if not found)
         """
-        if session_id not in self.sessions:
+        if self._redis is not None:
+            raw = self._redis.get(self._redis_key(session_id))
+            if raw is None:
+                print(f"⚠ Session {session_id} not found for update")
+                return None
+            session = json.loads(raw)
+
+            # Delta-write: only the changed section fields touch the hash
+            self._redis.hset(
+                self._redis_sections_key(session_id),
+                mapping={name: content for name, content in updated_sections.items()}
+            )
+
+            new_counts = {
+                name: _count_words(str(content))
+                for name, content in updated_sections.items()
+            }
+            session["word_counts"].update(new_counts)
+
+            session["total_words"] = sum(session["word_counts"].values())
+            session["last_accessed"] = datetime.now().isoformat()
+            self._redis_save_meta(session)
+
+            print(f"✅ Session {session_id} updated with {len(updated_sections)} section(s)")
+            return new_counts
+
+        session = self.sessions.get(session_id)
+        if session is None:
             print(f"⚠ Session {session_id} not found for update")
-            return
-        
-        # Update each section with new content
+            return None
+
+        # Update each section with new content (word counts updated incrementally)
+        new_counts = {}
         for section_name, new_content in updated_sections.items():
-            self.sessions[session_id]["sections"][section_name] = new_content
-        
+            session["sections"][section_name] = new_content
+            new_counts[section_name] = _count_words(str(new_content))
+
+        session["word_counts"].update(new_counts)
+        session["total_words"] = sum(session["word_counts"].values())
+
         # Update last accessed time
-        self.sessions[session_id]["last_accessed"] = datetime.now().isoformat()
-        
+        session["last_accessed"] = datetime.now().isoformat()
+
         print(f"✅ Session {session_id} updated with {len(updated_sections)} section(s)")
-    
-    
+        return new_counts
+
+
     def add_chat_message(
         self,
         session_id: str,
@@ -121,102 +298,149 @@ class SessionManager:
     ):
         """
         Add a message to chat history
-        
+
         Args:
             session_id: Session identifier
             role: 'user' or 'assistant'
             message: Message content
         """
-        if session_id not in self.sessions:
-            print(f"⚠ Session {session_id} not found for chat message")
-            return
-        
-        self.sessions[session_id]["chat_history"].append({
+        if self._redis is not None:
+            raw = self._redis.get(self._redis_key(session_id))
+            if raw is None:
+                print(f"⚠ Session {session_id} not found for chat message")
+                return
+            session = json.loads(raw)
+        else:
+            session = self.sessions.get(session_id)
+            if session is None:
+                print(f"⚠ Session {session_id} not found for chat message")
+                return
+
+        now_iso = datetime.now().isoformat()
+
+        session["chat_history"].append({
             "role": role,
             "message": message,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso
         })
-        
+
         # Update last accessed
-        self.sessions[session_id]["last_accessed"] = datetime.now().isoformat()
-    
-    
+        session["last_accessed"] = now_iso
+
+        if self._redis is not None:
+            self._redis_save_meta(session)
+
+
     def get_chat_history(self, session_id: str) -> list:
         """
         Get chat history for a session
-        
+
         Args:
             session_id: Session identifier
-        
+
         Returns:
             List of chat messages
         """
         session = self.get_session(session_id)
         if not session:
             return []
-        
+
         return session.get("chat_history", [])
-    
-    
+
+
     def delete_session(self, session_id: str) -> bool:
         """
         Delete a session
-        
+
         Args:
             session_id: Session identifier
-        
+
         Returns:
             True if deleted, False if not found
         """
+        if self._redis is not None:
+            deleted = self._redis.delete(
+                self._redis_key(session_id),
+                self._redis_sections_key(session_id)
+            )
+            if deleted:
+                print(f"✅ Session deleted: {session_id}")
+                return True
+            print(f"⚠ Session not found: {session_id}")
+            return False
+
         if session_id in self.sessions:
             del self.sessions[session_id]
             print(f"✅ Session deleted: {session_id}")
             return True
-        
+
         print(f"⚠ Session not found: {session_id}")
         return False
-    
-    
+
+
     def cleanup_expired_sessions(self):
-        """Clean up expired sessions"""
-        now = datetime.now()
-        expired = []
-        
-        for session_id, session in self.sessions.items():
-            created_at = datetime.fromisoformat(session["created_at"])
-            if now - created_at > self.session_timeout:
-                expired.append(session_id)
-        
-        for session_id in expired:
-            del self.sessions[session_id]
-        
-        if expired:
-            print(f"✅ Cleaned up {len(expired)} expired session(s)")
-    
-    
+        """Clean up expired sessions (Redis expires keys on its own)"""
+        if self._redis is not None:
+            return
+
+        now = time.time()
+        heap = self._expiry_heap
+        cleaned = 0
+
+        # Pop only entries that are actually due - O(k log N) for k
+        # expirations instead of a full scan with a datetime parse per
+        # session. Stale entries (session already deleted) fall through
+        # the pop; uuid4 ids are never reused with a fresh expiry.
+        while heap and heap[0][0] <= now:
+            _, session_id = heapq.heappop(heap)
+            if self.sessions.pop(session_id, None) is not None:
+                cleaned += 1
+
+        if cleaned:
+            print(f"✅ Cleaned up {cleaned} expired session(s)")
+
+
     def get_active_sessions_count(self) -> int:
         """Get count of active sessions"""
+        if self._redis is not None:
+            return sum(
+                1 for key in self._redis.scan_iter(match=f"{self.REDIS_PREFIX}*")
+                if not key.endswith(":sections")
+            )
         return len(self.sessions)
-    
-    
+
+
     def list_sessions(self) -> list:
         """
         List all active sessions
-        
+
         Returns:
             List of session summaries
         """
+        if self._redis is not None:
+            sessions = (
+                json.loads(raw)
+                for raw in (
+                    self._redis.get(key)
+                    for key in self._redis.scan_iter(match=f"{self.REDIS_PREFIX}*")
+                    if not key.endswith(":sections")
+                )
+                if raw is not None
+            )
+        else:
+            sessions = self.sessions.values()
+
         summaries = []
-        
-        for session_id, session in self.sessions.items():
+
+        for session in sessions:
             summaries.append({
-                "session_id": session_id,
+                "session_id": session["session_id"],
                 "topic": session["topic"],
                 "subject": session["subject"],
                 "created_at": session["created_at"],
                 "last_accessed": session["last_accessed"],
-                "section_count": len(session["sections"]),
+                "section_count": len(session.get("sections") or session.get("word_counts", {})),
                 "chat_message_count": len(session.get("chat_history", []))
             })
-        
+
         return summaries